@@ -0,0 +1,107 @@
+"""
+Benchmarks for the incremental Zobrist hash of the game state:
+how much it adds to the cost of a move, and how often distinct states collide
+"""
+import random
+import sys
+import time
+from math import expm1, log1p
+from sn2ke import Model, Controller
+
+
+# Every model is hashed with the same keys, as states would be in one transposition cache
+ZOBRIST_SEED = 0x2A2A2A2A2A2A2A2A
+
+
+def hashed_objects(model):
+    return Model.ViewableContainer(model.snakes, model.scores, model.apples, model.blocks)
+
+
+def new_model():
+    model = Model(keymaps=Controller.INDEPENDENT_KEY_MAPS)
+    model.zobrist = Model.Zobrist(ZOBRIST_SEED)
+    model.zobrist.track(hashed_objects(model))
+    return model
+
+
+def state_features(viewable):
+    """
+    Returns the exact state that the hash describes, as a sorted tuple of features
+    """
+    if isinstance(viewable, Model.ViewableContainer):
+        return tuple(sorted(feature for contained in viewable
+                            for feature in state_features(contained)))
+    return (viewable.zobrist_feature,)
+
+
+def random_step(model):
+    """
+    Turns each snake in a random direction that does not immediately collide, then moves it
+    :return: whether the game is still going
+    """
+    for snake in model.snakes:
+        head = snake.head
+        options = [direction for direction in Model.DIRECTIONS
+                   if not model.get_collision(Model.Viewable((head.xy[0]+direction[0],
+                                                              head.xy[1]+direction[1])))]
+        if options:
+            snake.dxdy = random.choice(options)
+        snake.move()
+        hit_item = model.get_collision(snake.head)
+        if hit_item:
+            hit_item.collision_callback(snake)
+    return not model.is_game_over()
+
+
+def bench_update_cost(n_moves):
+    hashed = new_model()
+    unhashed = new_model()
+    unhashed.zobrist.untrack(hashed_objects(unhashed))
+
+    timings = {}
+    for (name, model) in (('hashed', hashed), ('unhashed', unhashed)):
+        snake = model.snakes[0]
+        start = time.perf_counter()
+        for i in range(n_moves):
+            # Walk in a square so the snake never leaves the board
+            snake.dxdy = Model.DIRECTIONS[[3, 1, 2, 0][(i // 10) % 4]]
+            snake.move()
+        timings[name] = (time.perf_counter() - start) / n_moves
+
+    toggled = hashed.snakes[0].head
+    start = time.perf_counter()
+    for _ in range(n_moves):
+        hashed.zobrist.toggle(toggled)
+    toggle_time = (time.perf_counter() - start) / n_moves
+
+    print('Update cost over %d moves of a %d-piece snake:' % (n_moves, len(hashed.snakes[0].tail)+1))
+    print('  move with hashing:    %.2f us' % (1e6 * timings['hashed']))
+    print('  move without hashing: %.2f us' % (1e6 * timings['unhashed']))
+    print('  single toggle:        %.2f us' % (1e6 * toggle_time))
+
+
+def bench_collision_rate(n_states):
+    hashes_by_state = {}
+    model = new_model()
+    while len(hashes_by_state) < n_states:
+        if not random_step(model):
+            model = new_model()
+        # With shared keys, a state seen again in another game must hash the same way
+        features = state_features(hashed_objects(model))
+        assert hashes_by_state.setdefault(features, model.state_hash) == model.state_hash
+
+    print('Collisions among %d distinct states:' % len(hashes_by_state))
+    for bits in (16, 24, 32, 64):
+        mask = 2**bits - 1
+        n_distinct = len(set(state_hash & mask for state_hash in hashes_by_state.values()))
+        # Expected number of distinct values when drawing uniformly from 2**bits
+        expected_distinct = 2**bits * -expm1(len(hashes_by_state) * log1p(-1. / 2**bits))
+        print('  low %2d bits: %6d colliding states (%.1f expected for a uniform hash)' %
+              (bits, len(hashes_by_state) - n_distinct, len(hashes_by_state) - expected_distinct))
+
+
+if __name__ == '__main__':
+    random.seed(0)
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    bench_update_cost(n)
+    bench_collision_rate(n)
@@ -1,8 +1,13 @@
 import sys
 import curses
 import random
+import select
+import struct
 import threading
 import time
+import multiprocessing
+from collections import deque, OrderedDict
+from multiprocessing import shared_memory
 
 
 class View:
@@ -38,6 +43,7 @@ class View:
                 * Press UP to play mirror-mode
                 * Press DN to play switch-mirror-mode
                 * Press W to play two-handed mode
+                * Press B to play against the autopilot
                 * Press Q to quit
 """
 
@@ -53,6 +59,20 @@ class View:
         stdscr.addstr(0, 0, self.DEAD_MESSAGE, curses.color_pair(View.COLORS['red']))
         stdscr.refresh()
 
+    def show_input_latency(self, stdscr, snakes):
+        """
+        Shows how long each snake's keypresses waited before being applied
+        """
+        row = len(self.DEAD_MESSAGE.splitlines()) + 1
+        for snake in snakes:
+            latencies = list(snake.input_latencies)
+            if latencies:
+                stdscr.addstr(row, 4, 'Input latency: mean %.0f ms, max %.0f ms' %
+                              (1000 * sum(latencies) / len(latencies), 1000 * max(latencies)),
+                              curses.color_pair(snake.head_color))
+                row += 1
+        stdscr.refresh()
+
     def show_home_screen(self, stdscr):
         stdscr.clear()
         stdscr.addstr(5, 0, self.WELCOME_MESSAGE, curses.color_pair(View.COLORS['green']))
@@ -83,6 +103,13 @@ class Model:
 
     class Viewable(object):
 
+        # The World that is notified when the viewable moves, if any
+        world = None
+        # The Zobrist hash that is updated when the viewable changes, if any
+        zobrist = None
+        # Distinguishes the type of viewable in the Zobrist hash
+        ZOBRIST_KIND = 0
+
         def __init__(self, xy, icon=None, color=0):
             (self._xy, self.color) = (xy, color)
             
@@ -99,9 +126,16 @@ class Model:
 
         @xy.setter
         def xy(self, xy):
+            if self.world is not None:
+                self.world.remove(self)
+            if self.zobrist is not None:
+                self.zobrist.toggle(self)
             self._viewable_by_location = {tuple(xy): self}
             self._xy = xy
-            # TODO: Notify containing object when the viewable changes?
+            if self.world is not None:
+                self.world.add(self)
+            if self.zobrist is not None:
+                self.zobrist.toggle(self)
 
         @property
         def viewables_by_location(self):
@@ -110,6 +144,13 @@ class Model:
             """
             return self._viewable_by_location
 
+        @property
+        def zobrist_feature(self):
+            """
+            Returns the tuple of integers that describes this viewable in the Zobrist hash
+            """
+            return (self.ZOBRIST_KIND, self.xy[0], self.xy[1])
+
     class Collidable(Viewable):
 
         def collision_callback(self, *args):
@@ -148,12 +189,20 @@ class Model:
                     self.viewables.append(viewable)
                 else:
                     self.viewables = [viewable]
+                if self.world is not None:
+                    self.world.track(viewable)
+                if self.zobrist is not None:
+                    self.zobrist.track(viewable)
             else:
                 raise Exception('Attempted to append non-viewable %s to viewable container'
                                 % viewable)
 
         def remove(self, item):
             del self.viewables[self.viewables.index(item)]
+            if self.world is not None:
+                self.world.untrack(item)
+            if self.zobrist is not None:
+                self.zobrist.untrack(item)
 
         def __iter__(self):
             for viewable in self.viewables:
@@ -196,6 +245,227 @@ class Model:
         def __repr__(self):
             return "%s{%s}" % (type(self).__name__, self.viewables)
 
+    class Chunk(object):
+        """
+        A fixed-size square of cells.
+        Each occupied cell holds a list of the viewables in it, most recently added last
+        """
+
+        def __init__(self, size):
+            self.cells = [None] * (size * size)
+            self.count = 0
+
+    class World(object):
+        """
+        Sparse storage of viewables by location.
+        The world is divided into fixed-size chunks, which are allocated when the first viewable
+        enters them and freed when the last one leaves, so memory is proportional to the
+        occupied area rather than to the size of the board
+        """
+
+        CHUNK_SIZE = 16
+
+        def __init__(self, chunk_size=CHUNK_SIZE):
+            self.chunk_size = chunk_size
+            self.chunks = {}
+            # Each snake moves on its own thread, and the bot reads the whole world while they do,
+            # so cells, counts and the chunk map are only touched while holding this lock
+            self.lock = threading.Lock()
+
+        def _locate(self, xy):
+            """
+            Returns the key of the chunk containing xy, and the index of xy within that chunk
+            """
+            (x, y) = (int(xy[0]), int(xy[1]))
+            return ((x // self.chunk_size, y // self.chunk_size),
+                    (x % self.chunk_size) * self.chunk_size + y % self.chunk_size)
+
+        def get(self, xy):
+            """
+            Returns the viewable most recently placed at xy, or None if the cell is empty
+            """
+            (key, index) = self._locate(xy)
+            with self.lock:
+                chunk = self.chunks.get(key)
+                if not chunk or not chunk.cells[index]:
+                    return None
+                return chunk.cells[index][-1]
+
+        def add(self, viewable):
+            """
+            Places a viewable at its location, on top of whatever was there before
+            """
+            (key, index) = self._locate(viewable.xy)
+            with self.lock:
+                chunk = self.chunks.get(key)
+                if not chunk:
+                    chunk = self.chunks[key] = Model.Chunk(self.chunk_size)
+                if chunk.cells[index] is None:
+                    chunk.cells[index] = [viewable]
+                    chunk.count += 1
+                else:
+                    chunk.cells[index].append(viewable)
+
+        def remove(self, viewable):
+            """
+            Removes a viewable from its location,
+            uncovering anything that was placed there before it
+            """
+            (key, index) = self._locate(viewable.xy)
+            with self.lock:
+                chunk = self.chunks.get(key)
+                if not chunk or not chunk.cells[index]:
+                    return
+                occupants = chunk.cells[index]
+                for (i, occupant) in enumerate(occupants):
+                    if occupant is viewable:
+                        del occupants[i]
+                        break
+                if not occupants:
+                    chunk.cells[index] = None
+                    chunk.count -= 1
+                    if chunk.count == 0:
+                        del self.chunks[key]
+
+        def track(self, viewable):
+            """
+            Adds a viewable, or every viewable within a ViewableContainer,
+            and keeps the world up to date as they move or are appended and removed
+            """
+            viewable.world = self
+            if isinstance(viewable, Model.ViewableContainer):
+                for contained in viewable:
+                    self.track(contained)
+            else:
+                self.add(viewable)
+
+        def untrack(self, viewable):
+            if isinstance(viewable, Model.ViewableContainer):
+                for contained in viewable:
+                    self.untrack(contained)
+            else:
+                self.remove(viewable)
+            viewable.world = None
+
+        def in_range(self, top_left, bottom_right):
+            """
+            Returns a {location:viewable} dict for all viewables within the rectangle,
+            including its edges. Only allocated chunks are visited
+            """
+            (first_key, _) = self._locate(top_left)
+            (last_key, _) = self._locate(bottom_right)
+            locations = {}
+            with self.lock:
+                n_keys = (last_key[0]-first_key[0]+1) * (last_key[1]-first_key[1]+1)
+                if n_keys <= len(self.chunks):
+                    keys = [(chunk_x, chunk_y)
+                            for chunk_x in range(first_key[0], last_key[0]+1)
+                            for chunk_y in range(first_key[1], last_key[1]+1)
+                            if (chunk_x, chunk_y) in self.chunks]
+                else:
+                    keys = [key for key in self.chunks
+                            if first_key[0] <= key[0] <= last_key[0] and
+                            first_key[1] <= key[1] <= last_key[1]]
+
+                for key in keys:
+                    for (index, occupants) in enumerate(self.chunks[key].cells):
+                        if not occupants:
+                            continue
+                        xy = (key[0]*self.chunk_size + index // self.chunk_size,
+                              key[1]*self.chunk_size + index % self.chunk_size)
+                        if top_left[0] <= xy[0] <= bottom_right[0] and \
+                                top_left[1] <= xy[1] <= bottom_right[1]:
+                            locations[xy] = occupants[-1]
+            return locations
+
+        def __len__(self):
+            """
+            Returns the number of occupied cells
+            """
+            with self.lock:
+                return sum(chunk.count for chunk in self.chunks.values())
+
+    class Zobrist(object):
+        """
+        64-bit Zobrist-style hash of the game state.
+        Each tracked viewable XORs in a key for its zobrist_feature, and toggles it out and back in
+        whenever it changes, so the hash is updated in O(1) per change.
+        Keys are derived by mixing the feature with a random seed rather than drawn into a table
+        up front, so memory stays bounded even on large arenas
+        """
+
+        MASK = 2**64 - 1
+        # Computed keys are memoized. The memo is emptied once it holds this many,
+        # which keeps memory bounded without tracking how recently each key was used
+        KEY_CACHE_SIZE = 2**16
+
+        def __init__(self, seed=None):
+            self.seed = random.getrandbits(64) if seed is None else seed
+            self.value = 0
+            self.keys = {}
+            # Both snake threads toggle the hash, and the XOR must not be split by a thread switch
+            self.lock = threading.Lock()
+
+        @staticmethod
+        def _mix(z):
+            """
+            The splitmix64 finalizer
+            """
+            z = (z + 0x9E3779B97F4A7C15) & Model.Zobrist.MASK
+            z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & Model.Zobrist.MASK
+            z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & Model.Zobrist.MASK
+            return z ^ (z >> 31)
+
+        def key(self, feature):
+            try:
+                return self.keys[feature]
+            except KeyError:
+                pass
+            # Combine the feature FNV-style, then scramble the result once
+            z = self.seed
+            for value in feature:
+                z = ((z ^ int(value)) * 0x100000001B3) & self.MASK
+            if len(self.keys) >= self.KEY_CACHE_SIZE:
+                self.keys.clear()
+            self.keys[feature] = z = self._mix(z)
+            return z
+
+        def toggle(self, viewable):
+            key = self.key(viewable.zobrist_feature)
+            with self.lock:
+                self.value ^= key
+
+        def track(self, viewable):
+            """
+            Adds a viewable, or every viewable within a ViewableContainer, to the hash
+            and keeps the hash up to date as they change or are appended and removed
+            """
+            viewable.zobrist = self
+            if isinstance(viewable, Model.ViewableContainer):
+                for contained in viewable:
+                    self.track(contained)
+            else:
+                self.toggle(viewable)
+
+        def untrack(self, viewable):
+            if isinstance(viewable, Model.ViewableContainer):
+                for contained in viewable:
+                    self.untrack(contained)
+            else:
+                self.toggle(viewable)
+            viewable.zobrist = None
+
+        def full_hash(self, viewable):
+            """
+            Computes the hash of a viewable or ViewableContainer from scratch, without tracking it
+            """
+            if isinstance(viewable, Model.ViewableContainer):
+                value = 0
+                for contained in viewable:
+                    value ^= self.full_hash(contained)
+                return value
+            return self.key(viewable.zobrist_feature)
+
     class SnakePiece(Viewable):
 
         DEFAULT_COLOR = View.COLORS['green']
@@ -234,12 +504,17 @@ class Model:
             Only allow setting of direction if it is not in the opposite direction
             """
             if not self.is_opposite_direction(dxdy):
+                if self.zobrist is not None:
+                    self.zobrist.toggle(self)
                 self._dxdy = dxdy
+                if self.zobrist is not None:
+                    self.zobrist.toggle(self)
 
     class TailPiece(SnakePiece, Collidable):
 
         VERTICAL_CHAR = '|'
         HORIZONTAL_CHAR = '-'
+        ZOBRIST_KIND = 1
 
         def __init__(self,
                      parent,
@@ -262,6 +537,11 @@ class Model:
         def collision_callback(self, snake):
             snake.dead = True
 
+        @property
+        def zobrist_feature(self):
+            # The direction of a TailPiece always points at its leader, so only position matters
+            return (self.ZOBRIST_KIND, self.parent.index, self.xy[0], self.xy[1])
+
         @property
         def icon(self):
             if self.dxdy[0] != 0:
@@ -272,7 +552,9 @@ class Model:
                 raise Exception('No icon defined for stationary TailPiece')
 
         def move(self):
-            (self.dxdy, self.xy) = \
+            # A TailPiece can never be turned around, and its direction is not part of the
+            # Zobrist hash, so the checks in the dxdy setter are skipped
+            (self._dxdy, self.xy) = \
                     (self.leader.dxdy[:], self.leader.xy[:])
 
     class HeadPiece(SnakePiece):
@@ -281,11 +563,17 @@ class Model:
         LEFT_CHAR = '<'
         RIGHT_CHAR = '>'
         DEFAULT_COLOR = View.COLORS['yellow']
+        ZOBRIST_KIND = 2
 
         def __init__(self, *args, **kwargs):
             super(Model.HeadPiece, self).__init__(*args, **kwargs)
             self.color = self.DEFAULT_COLOR
 
+        @property
+        def zobrist_feature(self):
+            return (self.ZOBRIST_KIND, self.parent.index,
+                    self.xy[0], self.xy[1], self.dxdy[0], self.dxdy[1])
+
         @property
         def icon(self):
             if self.dxdy == Model.DOWN:
@@ -304,6 +592,11 @@ class Model:
         VERTICAL_SPEED = 10
         HORIZONTAL_SPEED = 15
 
+        # Keypresses beyond this many pending direction changes are dropped
+        COMMAND_QUEUE_LENGTH = 3
+        # Number of recent input latencies that are kept for reporting
+        LATENCY_HISTORY = 100
+
         def __init__(self, xy, dxdy, length, keymap):
 
             (self.xy, self._dxdy, self.length, self.keymap ) = \
@@ -313,6 +606,12 @@ class Model:
             self.full_body = Model.ViewableContainer(self.head, self.tail)
             self.dead = False
             self.tail_color = None
+            # Distinguishes the snakes of a Model in the Zobrist hash
+            self.index = 0
+            # Pending (dxdy, time of keypress) commands, consumed one per move
+            self.commands = deque()
+            self.commands_lock = threading.Lock()
+            self.input_latencies = deque(maxlen=self.LATENCY_HISTORY)
             super(Model.Snake, self).__init__(self.full_body)
 
         def create_tail(self, head, length):
@@ -337,8 +636,33 @@ class Model:
             if self.tail_color:
                 self.tail[-1].color = self.tail_color
 
-        def is_colliding_with_self(self):
-            return self.xy in self.tail.viewables_by_location
+        def queue_command(self, dxdy, timestamp):
+            """
+            Queues a change of direction, to be applied on a following move.
+            Commands that would not turn the snake (relative to the last queued direction),
+            or that arrive while the queue is full, are dropped
+            :param timestamp: time.time() at which the key was pressed
+            :return: whether the command was queued
+            """
+            with self.commands_lock:
+                last_dxdy = self.commands[-1][0] if self.commands else self.head.dxdy
+                if len(self.commands) >= self.COMMAND_QUEUE_LENGTH or \
+                        (dxdy[0] in (last_dxdy[0], -last_dxdy[0]) and
+                         dxdy[1] in (last_dxdy[1], -last_dxdy[1])):
+                    return False
+                self.commands.append((dxdy, timestamp))
+                return True
+
+        def apply_next_command(self):
+            """
+            Applies the oldest queued command, if any, and records how long it waited
+            """
+            with self.commands_lock:
+                if not self.commands:
+                    return
+                (dxdy, timestamp) = self.commands.popleft()
+            self.dxdy = dxdy
+            self.input_latencies.append(time.time() - timestamp)
 
         def move(self):
             for piece in self.tail[::-1]:
@@ -381,6 +705,7 @@ class Model:
     class Apple(Collidable):
 
         DEFAULT_COLOR = View.COLORS['red']
+        ZOBRIST_KIND = 3
 
         def __init__(self, xy, model):
             super(Model.Apple, self).__init__(xy, View.APPLE_CHAR)
@@ -398,6 +723,8 @@ class Model:
 
     class Block(Collidable):
 
+        ZOBRIST_KIND = 4
+
         def __init__(self, xy):
             super(Model.Block, self).__init__(xy, View.BLOCK_CHAR)
 
@@ -433,6 +760,8 @@ class Model:
         The viewable number that designates the score
         """
         # TODO: I don't actually know what happens if the score goes above 9
+        ZOBRIST_KIND = 5
+
         def __init__(self, xy, value=0, color=None):
             self._value = value
             super(Model.ScoreNumber, self).__init__(xy, str(value), color)
@@ -443,9 +772,17 @@ class Model:
 
         @value.setter
         def value(self, value):
+            if self.zobrist is not None:
+                self.zobrist.toggle(self)
             self._value = value
+            if self.zobrist is not None:
+                self.zobrist.toggle(self)
             self.icon = str(value)
 
+        @property
+        def zobrist_feature(self):
+            return (self.ZOBRIST_KIND, self.xy[0], self.xy[1], self.value)
+
     INIT_LENGTH = 5
 
     DEFAULT_WIDTH = 70
@@ -454,11 +791,26 @@ class Model:
     DEFAULT_N_APPLES = 2
     DEFAULT_N_BLOCKS = 1
 
+    # Number of random locations tried before spawning on an occupied cell
+    SPAWN_ATTEMPTS = 100
+
     def __init__(self, length=INIT_LENGTH,
                  n_apples=DEFAULT_N_APPLES, n_blocks=DEFAULT_N_BLOCKS,
                  width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT,
-                 paired=False, switching=False, keymaps=None):
-        (self.width, self.height, self.switching) = (width, height, switching)
+                 paired=False, switching=False, keymaps=None, large_arena=False):
+        """
+        :param large_arena: if True, the walls are not stored block by block,
+                            so that boards can be millions of cells wide.
+                            The edges of the board still end the game
+        """
+        (self.width, self.height, self.switching, self.large_arena) = \
+            (width, height, switching, large_arena)
+
+        # All collidable objects, by location
+        self.world = Model.World()
+
+        # Stands in for the walls when something goes beyond the edges of the board
+        self.boundary = Model.WallBlock([0, 0], False)
 
         # Create and color the snakes
         (xys, dxdys) = self.get_starting_locations(paired)
@@ -472,14 +824,19 @@ class Model:
         # Make a snake and value for each starting location
         for (i, (xy, dxdy, keymap)) in enumerate(zip(xys, dxdys, keymaps)):
             new_snake = Model.Snake(xy, dxdy, length, keymap)
+            new_snake.index = i
             new_snake.head_color = View.HEAD_COLORS[i]
             new_snake.tail_color = View.TAIL_COLORS[i]
             self.snakes += new_snake
             self.scores += Model.ScoreNumber([self.height, xy[1]],
                                              color=View.HEAD_COLORS[i])
 
+        for snake in self.snakes:
+            self.world.track(snake.tail)
+
         # Create the four walls
         self.walls = self.make_walls()
+        self.world.track(self.walls)
 
         # Obstacles and goals
         self.apples = self.random_apples(n_apples)
@@ -491,11 +848,18 @@ class Model:
                                                    self.scores,
                                                    self.snakes)
 
-        self.collidable_objects = Model.ViewableContainer(self.blocks,
-                                                          self.apples,
-                                                          self.walls,
-                                                          *[snake.tail[1:] for snake in
-                                                            self.snakes])
+        # The walls never change, so they are left out of the hash
+        self.zobrist = Model.Zobrist()
+        for container in (self.snakes, self.scores, self.apples, self.blocks):
+            self.zobrist.track(container)
+
+    @property
+    def state_hash(self):
+        """
+        64-bit hash of the positions and directions of the snakes, the apples, the blocks
+        and the scores, maintained incrementally as they change
+        """
+        return self.zobrist.value
 
     def switch_snakes(self):
         """
@@ -514,6 +878,8 @@ class Model:
         """ 
         Makes all four walls
         """
+        if self.large_arena:
+            return Model.ViewableContainer()
         return Model.ViewableContainer(*[
             Model.Wall([0, 0], self.width, False),
             Model.Wall([0, 0], self.height, True),
@@ -539,18 +905,44 @@ class Model:
 
     def random_location(self):
         """
-        Gets a random xy location somewhere within the game
+        Gets a random unoccupied xy location somewhere within the game.
+        Each attempt only looks at a single chunk of the world,
+        so this stays cheap on large, mostly empty boards
+        :return: the location, or None if no free location was found
         """
-        return random.randint(1, self.height-1), random.randint(1, self.width-1)
+        heads = [tuple(snake.head.xy) for snake in self.snakes]
+        for _ in range(self.SPAWN_ATTEMPTS):
+            xy = random.randint(1, self.height-1), random.randint(1, self.width-1)
+            if self.world.get(xy) is None and xy not in heads:
+                return xy
+        return None
+
+    def is_out_of_bounds(self, xy):
+        return not (0 < xy[0] < self.height and 0 < xy[1] < self.width)
+
+    def get_collision(self, viewable):
+        """
+        Returns the collidable object at the location of the viewable, or None
+        """
+        if self.is_out_of_bounds(viewable.xy):
+            return self.boundary
+        return self.world.get(viewable.xy)
 
     def random_apples(self, n_apples):
-        apples = [Model.Apple(self.random_location(), self)
-                  for _ in range(n_apples)]
-        return Model.ViewableContainer(*apples)
+        # Tracked while being filled, so that the apples do not land on each other
+        apples = Model.ViewableContainer()
+        self.world.track(apples)
+        for _ in range(n_apples):
+            xy = self.random_location()
+            if xy:
+                apples.append(Model.Apple(xy, self))
+        return apples
 
     def add_apple(self, xy=None):
         if not xy:
             xy = self.random_location()
+            if not xy:
+                return
         self.apples.append(Model.Apple(xy, self))
 
     def remove_apple(self, apple):
@@ -559,19 +951,25 @@ class Model:
     def add_block(self, xy=None):
         if not xy:
             xy = self.random_location()
+            if not xy:
+                return
         self.blocks.append(Model.Block(xy))
 
     def random_blocks(self, n_blocks):
-        blocks = [Model.Block(self.random_location())
-                  for _ in range(n_blocks)]
-        return Model.ViewableContainer(*blocks)
+        blocks = Model.ViewableContainer()
+        self.world.track(blocks)
+        for _ in range(n_blocks):
+            xy = self.random_location()
+            if xy:
+                blocks.append(Model.Block(xy))
+        return blocks
 
     def is_colliding(self, snake_num):
-        return self.snakes[snake_num].is_colliding_with_self() or \
-            self.is_colliding_with_environment(snake_num)
-
-    def is_colliding_with_environment(self, snake_num):
-        return self.snakes[snake_num].xy in self.blocks.viewables_by_location
+        """
+        Returns whether the head of the snake is on something that would kill it
+        """
+        hit_item = self.get_collision(self.snakes[snake_num].head)
+        return hit_item is not None and not isinstance(hit_item, Model.Apple)
 
     def is_game_over(self):
         return any([snake.dead for snake in self.snakes])
@@ -585,14 +983,286 @@ class Model:
                 score.value += 1
 
 
+class TranspositionCache:
+    """
+    Bounded cache of values keyed by Model.state_hash.
+    When full, the least recently used entry is evicted
+    """
+
+    DEFAULT_SIZE = 2**16
+
+    def __init__(self, max_size=DEFAULT_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        (self.hits, self.misses) = (0, 0)
+
+    def get(self, key, default=None):
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class Bot:
+    """
+    Monte-Carlo lookahead autopilot.
+    On each decision the board is published to a pool of worker processes through
+    shared memory, and each worker plays random rollouts from every candidate direction
+    until the per-move deadline
+    """
+
+    EMPTY = 0
+    OBSTACLE = 1
+    APPLE = 2
+
+    # Header is (generation, number of pieces, dx, dy), followed by (x, y) for each piece
+    HEADER_FORMAT = '4i'
+    MAX_PIECES = 1024
+
+    ROLLOUTS_PER_MOVE = 256
+    ROLLOUT_DEPTH = 60
+    APPLE_WEIGHT = 20
+    STRAIGHT_CHANCE = 0.5
+
+    # Fraction of the time between moves that may be spent deciding
+    BUDGET_FRACTION = 0.6
+    # Workers stop this many seconds before the deadline so their results arrive in time
+    RESULT_MARGIN = 0.005
+
+    # Per-process state of a worker, set by _attach_worker
+    _worker_state = None
+
+    def __init__(self, width=Model.DEFAULT_WIDTH, height=Model.DEFAULT_HEIGHT, n_workers=None):
+        """
+        Allocates the shared board and starts the workers, which are kept warm until close()
+        :param width: width of the Model the bot will play on
+        :param height: height of the Model the bot will play on
+        :param n_workers: (optional) number of worker processes, defaults to the cpu count
+        """
+        (self.rows, self.cols) = (height+1, width+1)
+        board_size = self.rows * self.cols
+        # Keep the integer section aligned
+        self.snake_offset = board_size + (-board_size % 4)
+        size = self.snake_offset + struct.calcsize(self.HEADER_FORMAT) + \
+            struct.calcsize('%di' % (2*self.MAX_PIECES))
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.generation = 0
+        # Decisions already made, by (Model.state_hash, snake index)
+        self.cache = TranspositionCache()
+        self.n_workers = n_workers if n_workers else multiprocessing.cpu_count()
+        self.lock = threading.Lock()
+        self.pool = multiprocessing.Pool(self.n_workers,
+                                         initializer=Bot._attach_worker,
+                                         initargs=(self.shm.name, self.rows,
+                                                   self.cols, self.snake_offset))
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+        self.shm.close()
+        self.shm.unlink()
+
+    def publish(self, model, snake):
+        """
+        Writes the board and the state of the snake into shared memory
+        :return: the generation number that workers must see for the state to be valid
+        """
+        board = bytearray(self.rows * self.cols)
+        collidables = model.world.in_range((0, 0), (self.rows-1, self.cols-1))
+        for (location, collidable) in collidables.items():
+            self._mark(board, location,
+                       self.APPLE if isinstance(collidable, Model.Apple) else self.OBSTACLE)
+        self._mark(board, snake.head.xy, self.OBSTACLE)
+
+        pieces = [snake.head.xy] + [piece.xy for piece in snake.tail][:self.MAX_PIECES-1]
+        flat_pieces = [int(coordinate) for xy in pieces for coordinate in xy]
+
+        # Invalidate the state while it is being written
+        struct.pack_into('i', self.shm.buf, self.snake_offset, -1)
+        self.shm.buf[:len(board)] = board
+        struct.pack_into('%di' % len(flat_pieces), self.shm.buf,
+                         self.snake_offset + struct.calcsize(self.HEADER_FORMAT), *flat_pieces)
+        self.generation += 1
+        struct.pack_into(self.HEADER_FORMAT, self.shm.buf, self.snake_offset,
+                         self.generation, len(pieces), *snake.head.dxdy)
+        return self.generation
+
+    def choose_direction(self, model, snake, deadline=None):
+        """
+        Picks the entry of Model.DIRECTIONS with the best expected survival and score
+        :param deadline: (optional) time.time() by which a decision must be made.
+                         Defaults to a fraction of the time until the snake's next move
+        :return: the chosen direction, or the current direction if no rollout finished in time
+        """
+        cached = self.cache.get((model.state_hash, snake.index))
+        if cached is not None:
+            return cached
+        if deadline is None:
+            deadline = time.time() + self.BUDGET_FRACTION / snake.speed
+        dxdy = tuple(snake.head.dxdy)
+        candidates = [direction for direction in Model.DIRECTIONS
+                      if direction != (-dxdy[0], -dxdy[1])]
+        rollouts_per_task = max(1, self.ROLLOUTS_PER_MOVE // self.n_workers)
+
+        with self.lock:
+            generation = self.publish(model, snake)
+            pending = [self.pool.apply_async(Bot._run_rollouts,
+                                             (generation, candidates, rollouts_per_task,
+                                              deadline - self.RESULT_MARGIN,
+                                              random.getrandbits(32)))
+                       for _ in range(self.n_workers)]
+
+            totals = {}
+            for result in pending:
+                try:
+                    outcomes = result.get(timeout=max(0, deadline - time.time()))
+                except multiprocessing.TimeoutError:
+                    continue
+                if outcomes is None:
+                    continue
+                for (direction, (value, n_rollouts)) in outcomes.items():
+                    (total_value, total_rollouts) = totals.get(direction, (0, 0))
+                    totals[direction] = (total_value + value, total_rollouts + n_rollouts)
+
+        averages = {direction: value / n_rollouts
+                    for (direction, (value, n_rollouts)) in totals.items() if n_rollouts > 0}
+        if not averages:
+            return dxdy
+        direction = max(averages, key=averages.get)
+        self.cache.put((model.state_hash, snake.index), direction)
+        return direction
+
+    def _mark(self, board, xy, value):
+        (x, y) = (int(xy[0]), int(xy[1]))
+        if 0 <= x < self.rows and 0 <= y < self.cols:
+            board[x*self.cols + y] = value
+
+    @staticmethod
+    def _attach_worker(shm_name, rows, cols, snake_offset):
+        """
+        Runs once in each worker process, attaching it to the shared board
+        """
+        Bot._worker_state = (shared_memory.SharedMemory(name=shm_name), rows, cols, snake_offset)
+
+    @staticmethod
+    def _read_state(generation):
+        """
+        Copies the published state out of shared memory
+        :return: (board, pieces, dxdy), or None if the state is not the requested generation
+        """
+        (shm, rows, cols, snake_offset) = Bot._worker_state
+        header_size = struct.calcsize(Bot.HEADER_FORMAT)
+        if struct.unpack_from('i', shm.buf, snake_offset)[0] != generation:
+            return None
+        (_, n_pieces, dx, dy) = struct.unpack_from(Bot.HEADER_FORMAT, shm.buf, snake_offset)
+        board = bytearray(shm.buf[:rows*cols])
+        flat_pieces = struct.unpack_from('%di' % (2*n_pieces), shm.buf, snake_offset + header_size)
+        # The parent may have started publishing a newer state while we were copying
+        if struct.unpack_from('i', shm.buf, snake_offset)[0] != generation:
+            return None
+        pieces = list(zip(flat_pieces[::2], flat_pieces[1::2]))
+        return board, pieces, (dx, dy)
+
+    @staticmethod
+    def _run_rollouts(generation, candidates, n_rollouts, deadline, seed):
+        """
+        Runs in a worker: plays up to n_rollouts random games, cycling through the candidate
+        first directions so that each gets a fair share of the time budget
+        :return: {direction: (summed value, number of rollouts played)},
+                 or None if the state is stale
+        """
+        state = Bot._read_state(generation)
+        if state is None:
+            return None
+        (board, pieces, _) = state
+        (_, rows, cols, _) = Bot._worker_state
+        rng = random.Random(seed)
+
+        outcomes = {direction: (0, 0) for direction in candidates}
+        played = 0
+        while played < n_rollouts and time.time() < deadline:
+            direction = candidates[played % len(candidates)]
+            (steps, apples) = Bot._rollout(bytearray(board), deque(pieces),
+                                           direction, rows, cols, rng)
+            (value, n_played) = outcomes[direction]
+            outcomes[direction] = (value + steps + Bot.APPLE_WEIGHT * apples, n_played + 1)
+            played += 1
+        return outcomes
+
+    @staticmethod
+    def _rollout(board, body, direction, rows, cols, rng):
+        """
+        Plays a single game on a private copy of the board.
+        Apples are not respawned, and blocks are not added
+        :return: (number of steps survived, number of apples eaten)
+        """
+        def cell(xy):
+            if 0 <= xy[0] < rows and 0 <= xy[1] < cols:
+                return board[xy[0]*cols + xy[1]]
+            return Bot.OBSTACLE
+
+        (steps, apples) = (0, 0)
+        while steps < Bot.ROLLOUT_DEPTH:
+            head = body[0]
+            new_head = (head[0]+direction[0], head[1]+direction[1])
+            contents = cell(new_head)
+            if contents == Bot.APPLE:
+                apples += 1
+            else:
+                # The end of the tail moves out of the way before the head arrives
+                end = body.pop()
+                board[end[0]*cols + end[1]] = Bot.EMPTY
+                if cell(new_head) == Bot.OBSTACLE:
+                    return steps, apples
+            board[new_head[0]*cols + new_head[1]] = Bot.OBSTACLE
+            body.appendleft(new_head)
+            steps += 1
+
+            # Heuristic policy: eat adjacent apples, otherwise prefer going straight
+            reverse = (-direction[0], -direction[1])
+            options = [option for option in Model.DIRECTIONS if option != reverse and
+                       cell((new_head[0]+option[0], new_head[1]+option[1])) != Bot.OBSTACLE]
+            if not options:
+                options = [direction]
+            apple_options = [option for option in options
+                             if cell((new_head[0]+option[0], new_head[1]+option[1])) == Bot.APPLE]
+            if apple_options:
+                direction = rng.choice(apple_options)
+            elif direction not in options or rng.random() > Bot.STRAIGHT_CHANCE:
+                direction = rng.choice(options)
+        return steps, apples
+
+
 class Controller:
     RENDER_SPEED = 200
 
     CHOOSE_PAIRED_KEY = curses.KEY_UP
     CHOOSE_SWITCH_KEY = curses.KEY_DOWN
     CHOOSE_INDEPENDENT_KEY = ord('w')
+    CHOOSE_BOT_KEY = ord('b')
     STOP_KEY = ord('q')
 
+    # Seconds the input thread waits for a keypress before checking whether the round is over
+    INPUT_POLL_TIMEOUT = 0.05
+    # Seconds the dead message is shown before returning to the home screen
+    DEAD_MESSAGE_TIME = 2
+
     PAIRED_KEY_MAPS = [{
         curses.KEY_DOWN: Model.DOWN,
         curses.KEY_UP: Model.UP,
@@ -627,31 +1297,53 @@ class Controller:
         self.view = View()
         self.interrupted = False
         self.model = None
+        # The bot's workers are started the first time the autopilot is chosen
+        self.bot = None
+        self.autopiloted_snake = None
 
     def _monitor_keypress(self, stdscr):
         """
         The loop that monitors the keypresses during the game
-        and changes the direction of the snakes
+        and queues direction changes for the snakes.
+        Waits on stdin with a timeout, so it exits soon after the round is interrupted
         """
+        stdscr.nodelay(1)
         while not self.interrupted:
+            (readable, _, _) = select.select([sys.stdin], [], [], self.INPUT_POLL_TIMEOUT)
+            if not readable:
+                continue
+            timestamp = time.time()
             char_pressed = stdscr.getch()
-            if char_pressed == self.STOP_KEY:
-                self.interrupted = True
-                break
-            for snake in self.model.snakes:
-                if char_pressed in snake.keymap:
-                    snake.dxdy = snake.keymap[char_pressed]
+            while char_pressed != -1:
+                if char_pressed == self.STOP_KEY:
+                    self.interrupted = True
+                    break
+                for snake in self.model.snakes:
+                    if snake is self.autopiloted_snake:
+                        continue
+                    if char_pressed in snake.keymap:
+                        snake.queue_command(snake.keymap[char_pressed], timestamp)
+                char_pressed = stdscr.getch()
+        stdscr.nodelay(0)
 
     def _advance_single_snake_loop(self, snake):
         """
         Calls the "move" function of a single snake in a loop
         """
         while not self.model.is_game_over() and not self.interrupted:
+            snake.apply_next_command()
             snake.move()
-            hit_item = self.model.collidable_objects.get_collision(snake.head)
+            hit_item = self.model.get_collision(snake.head)
             if hit_item:
                 hit_item.collision_callback(snake)
-            time.sleep(1./snake.speed)
+            if self.model.is_game_over() or self.interrupted:
+                break
+            next_move = time.time() + 1./snake.speed
+            if snake is self.autopiloted_snake:
+                # Think while waiting for the next move
+                deadline = time.time() + self.bot.BUDGET_FRACTION/snake.speed
+                snake.dxdy = self.bot.choose_direction(self.model, snake, deadline)
+            time.sleep(max(0, next_move - time.time()))
 
     def start_game(self):
         """
@@ -665,6 +1357,7 @@ class Controller:
         while ch != self.STOP_KEY:
             self.view.show_home_screen(self.stdscr)
             ch = self.stdscr.getch()
+            self.autopiloted_snake = None
             if ch == self.CHOOSE_INDEPENDENT_KEY:
                 self.model = Model(paired=False, keymaps=self.INDEPENDENT_KEY_MAPS)
                 self.play_round(self.stdscr)
@@ -674,8 +1367,18 @@ class Controller:
             elif ch == self.CHOOSE_SWITCH_KEY:
                 self.model = Model(paired=True, switching=True, keymaps=self.PAIRED_KEY_MAPS)
                 self.play_round(self.stdscr)
+            elif ch == self.CHOOSE_BOT_KEY:
+                if not self.bot:
+                    self.bot = Bot()
+                # The autopilot takes the place of the WASD player
+                self.model = Model(paired=False, keymaps=self.INDEPENDENT_KEY_MAPS)
+                self.autopiloted_snake = next(snake for snake in self.model.snakes
+                                              if snake.keymap is self.INDEPENDENT_KEY_MAPS[0])
+                self.play_round(self.stdscr)
 
         # Teardown
+        if self.bot:
+            self.bot.close()
         curses.nocbreak()
         self.stdscr.keypad(0)
         curses.echo()
@@ -689,13 +1392,21 @@ class Controller:
         keypress_thread = threading.Thread(target=self._monitor_keypress,
                                            args=[stdscr])
         keypress_thread.start()
+        snake_threads = []
         for snake in self.model.snakes:
             snake_thread = threading.Thread(target=self._advance_single_snake_loop,
                                             args=[snake])
             snake_thread.start()
+            snake_threads.append(snake_thread)
 
         self._render_loop(stdscr)
-        stdscr.getch()
+        keypress_thread.join()
+        for snake_thread in snake_threads:
+            snake_thread.join()
+        self.view.show_input_latency(stdscr, self.model.snakes)
+        time.sleep(self.DEAD_MESSAGE_TIME)
+        # Keys pressed while the dead message was shown should not choose the next game
+        curses.flushinp()
 
     def _render_loop(self, stdscr):
         """
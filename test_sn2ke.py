@@ -1,5 +1,6 @@
 __author__ = 'iped'
 from sn2ke import *
+import time
 import unittest
 
 
@@ -12,5 +13,100 @@ class MyTestCase(unittest.TestCase):
         self.assertEqual(len(snake.tail), 5)
         self.assertEqual(len(snake), 6)
 
+    def test_double_turn_is_queued(self):
+        snake = Model.Snake([10, 10], Model.RIGHT, 5, {})
+        self.assertTrue(snake.queue_command(Model.UP, time.time()))
+        self.assertFalse(snake.queue_command(Model.DOWN, time.time()))
+        self.assertTrue(snake.queue_command(Model.LEFT, time.time()))
+        snake.apply_next_command()
+        snake.move()
+        self.assertEqual(snake.head.xy, (9, 10))
+        snake.apply_next_command()
+        snake.move()
+        self.assertEqual(snake.head.xy, (9, 9))
+        self.assertEqual(len(snake.input_latencies), 2)
+
+    def test_world_frees_empty_chunks(self):
+        world = Model.World()
+        block = Model.Block((3, 3))
+        world.track(block)
+        self.assertIs(world.get((3, 3)), block)
+        self.assertEqual(len(world.chunks), 1)
+        block.xy = (3, 3 + 2*world.chunk_size)
+        self.assertIsNone(world.get((3, 3)))
+        self.assertEqual(len(world.chunks), 1)
+        self.assertEqual(world.in_range((0, 0), (10, 10*world.chunk_size)), {block.xy: block})
+        world.untrack(block)
+        self.assertEqual(len(world.chunks), 0)
+
+    def test_world_uncovers_earlier_occupant(self):
+        model = Model(keymaps=Controller.INDEPENDENT_KEY_MAPS)
+        snake = model.snakes[0]
+        model.add_block(snake.head.xy)
+        block = model.blocks[-1]
+        snake.move()
+        self.assertIs(model.get_collision(block), snake.tail[0])
+        for _ in range(len(snake.tail)):
+            snake.move()
+        self.assertIs(model.get_collision(block), block)
+
+    def test_random_location_avoids_occupied_cells(self):
+        model = Model(width=3, height=3, n_apples=0, n_blocks=0,
+                      keymaps=Controller.INDEPENDENT_KEY_MAPS, large_arena=True)
+        for snake in model.snakes:
+            model.world.untrack(snake.tail)
+        model.snakes[0].head.xy = (1, 1)
+        model.snakes[1].head.xy = (1, 2)
+        model.add_block((2, 1))
+        self.assertEqual(model.random_location(), (2, 2))
+        model.add_block((2, 2))
+        self.assertIsNone(model.random_location())
+
+    def test_large_arena(self):
+        model = Model(width=3*10**3, height=10**6, large_arena=True,
+                      keymaps=Controller.INDEPENDENT_KEY_MAPS)
+        self.assertLess(len(model.world.chunks), 10)
+        snake = model.snakes[0]
+        snake.dxdy = Model.LEFT
+        for _ in range(snake.head.xy[1]):
+            snake.move()
+        self.assertIs(model.get_collision(snake.head), model.boundary)
+
+    def test_state_hash_is_incremental(self):
+        model = Model(keymaps=Controller.INDEPENDENT_KEY_MAPS)
+        snake = model.snakes[0]
+        initial_hash = model.state_hash
+        snake.dxdy = Model.LEFT
+        self.assertNotEqual(model.state_hash, initial_hash)
+        snake.dxdy = Model.DOWN
+        self.assertEqual(model.state_hash, initial_hash)
+
+        model.apples[0].xy = (snake.head.xy[0]+1, snake.head.xy[1])
+        snake.move()
+        model.get_collision(snake.head).collision_callback(snake)
+        snake.move()
+        self.assertEqual(model.state_hash, model.zobrist.full_hash(
+            Model.ViewableContainer(model.snakes, model.scores, model.apples, model.blocks)))
+
+    def test_transposition_cache_evicts_least_recently_used(self):
+        cache = TranspositionCache(max_size=2)
+        cache.put(1, 'a')
+        cache.put(2, 'b')
+        self.assertEqual(cache.get(1), 'a')
+        cache.put(3, 'c')
+        self.assertNotIn(2, cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_bot_avoids_block(self):
+        model = Model(keymaps=Controller.INDEPENDENT_KEY_MAPS)
+        snake = model.snakes[0]
+        model.add_block((snake.head.xy[0]+1, snake.head.xy[1]))
+        bot = Bot(model.width, model.height, n_workers=2)
+        try:
+            direction = bot.choose_direction(model, snake, time.time() + 0.5)
+        finally:
+            bot.close()
+        self.assertIn(direction, [Model.LEFT, Model.RIGHT])
+
 if __name__ == '__main__':
     unittest.main()